@@ -1,32 +1,74 @@
+import asyncio
 import os
 import sqlite3
-import random
+import secrets
+import threading
+from contextlib import contextmanager
+from itertools import groupby
+from operator import itemgetter
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Application, CommandHandler, ContextTypes, CallbackQueryHandler
+from telegram.error import RetryAfter
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    CommandHandler,
+    ContextTypes,
+    filters,
+)
 
 # Токен бота и путь к существующей БД
 BOT_TOKEN = os.environ["BOT_TOKEN"]
 DB_PATH = os.environ.get("DB_PATH", "santa.sqlite")
 
 # Админы (список user_id через запятую в переменной ADMIN_IDS)
-ADMIN_IDS = {
+ADMIN_IDS = frozenset(
     int(x)
     for x in os.environ.get("ADMIN_IDS", "").split(",")
-    if x.strip().isdigit()
-}
+    if x.strip().removeprefix("-").isdecimal()
+)
 
 
-def is_admin(user_id: int) -> bool:
-    return user_id in ADMIN_IDS
+# Случайность для жеребьёвки — из CSPRNG ОС: состояние Mersenne Twister
+# в принципе восстановимо по его выдаче, а SystemRandom вдобавок не держит
+# разделяемого состояния, так что параллельные /draw из пула потоков
+# не конкурируют.
+_RNG = secrets.SystemRandom()
 
 
+def normalize_username(username):
+    """Каноничный username: без @ и в нижнем регистре (или None)"""
+    return (username or "").strip().lstrip("@").lower() or None
+
+
+# Единственное долгоживущее соединение с БД (открывается в init_db).
+# Переоткрывать его на каждую команду дорого: open + чтение заголовка WAL
+# + PRAGMA на каждый /wish и /mywish.
+_CONN = None
+_DB_LOCK = threading.RLock()
+
+
+@contextmanager
 def db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.execute("PRAGMA foreign_keys=ON")
-    return conn
+    """Общее соединение: блокировка + транзакция на время блока"""
+    with _DB_LOCK:
+        with _CONN:
+            yield _CONN
 
 
 def init_db():
+    global _CONN
+    _CONN = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+    _CONN.row_factory = sqlite3.Row
+    _CONN.execute("PRAGMA foreign_keys=ON")
+    # Настройки под профиль бота: много мелких чтений, редкие пачки записей.
+    # WAL + synchronous=NORMAL — fsync только на checkpoint, читатели не
+    # блокируются писателем; остальное держит маленькую базу целиком в памяти.
+    _CONN.execute("PRAGMA journal_mode=WAL")
+    _CONN.execute("PRAGMA synchronous=NORMAL")
+    _CONN.execute("PRAGMA busy_timeout=5000")
+    _CONN.execute("PRAGMA cache_size=-20000")
+    _CONN.execute("PRAGMA temp_store=MEMORY")
+    _CONN.execute("PRAGMA mmap_size=134217728")
     with db() as conn:
         conn.executescript(
             """
@@ -43,21 +85,130 @@ def init_db():
             chat_id INTEGER,
             giver_id INTEGER,
             receiver_id INTEGER,
+            sent_at TEXT,
             PRIMARY KEY (chat_id, giver_id)
         );
+
+        -- Поиск дарителя по получателю (кнопка "Отправить дарителю"):
+        -- PK (chat_id, giver_id) тут не помогает, нужен свой индекс.
+        -- giver_id в составе индекса делает его покрывающим.
+        CREATE INDEX IF NOT EXISTS idx_pairs_receiver
+            ON pairs(chat_id, receiver_id, giver_id);
         """
         )
 
-
-def display(username, name):
-    if username:
-        return f"@{username}"
-    if name:
-        return name
-    return ""
+        # Миграция для баз, созданных до появления sent_at
+        try:
+            conn.execute("ALTER TABLE pairs ADD COLUMN sent_at TEXT")
+        except sqlite3.OperationalError:
+            pass  # колонка уже есть
+
+
+# Весь SQL — модульные константы: кэш подготовленных выражений sqlite3
+# срабатывает только при точном совпадении текста запроса, а константы
+# гарантируют одну каноничную строку на запрос.
+
+# RETURNING отдаёт строку только при реальной вставке (требует
+# SQLite >= 3.35 — в сборках CPython 3.10+ он новее).
+SQL_INSERT_PARTICIPANT = """
+INSERT OR IGNORE INTO participants
+(chat_id, user_id, username, full_name)
+VALUES (?, ?, ?, ?)
+RETURNING user_id
+"""
+
+# Регистрация (если участника ещё нет) и запись пожелания одним запросом.
+SQL_UPSERT_WISH = """
+INSERT INTO participants
+(chat_id, user_id, username, full_name, wishlist)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (chat_id, user_id) DO UPDATE SET
+    wishlist = excluded.wishlist,
+    username = excluded.username,
+    full_name = excluded.full_name
+WHERE participants.wishlist IS NOT excluded.wishlist
+   OR participants.username IS NOT excluded.username
+   OR participants.full_name IS NOT excluded.full_name
+"""
+
+SQL_GET_WISH = """
+SELECT wishlist
+FROM participants
+WHERE chat_id = ? AND user_id = ?
+"""
+
+# Даритель и пожелание получателя одним запросом.
+SQL_GIVER_AND_WISH = """
+SELECT p.giver_id, pa.wishlist
+FROM pairs p
+JOIN participants pa
+    ON pa.chat_id = p.chat_id AND pa.user_id = p.receiver_id
+WHERE p.chat_id = ? AND p.receiver_id = ?
+"""
+
+SQL_CHAT_PARTICIPANTS = "SELECT user_id FROM participants WHERE chat_id = ?"
+
+SQL_DELETE_PAIRS = "DELETE FROM pairs WHERE chat_id = ?"
+
+SQL_INSERT_PAIR = "INSERT INTO pairs (chat_id, giver_id, receiver_id) VALUES (?, ?, ?)"
+
+# Пары текущего чата вместе с готовым к отправке текстом: отображаемое
+# имя получателя и пожелание (или заглушка) собираются прямо в SQL.
+SQL_PAIRS_WITH_WISHES = """
+SELECT
+    p.giver_id,
+    COALESCE('@' || NULLIF(r.username, ''), NULLIF(r.full_name, ''),
+             CAST(p.receiver_id AS TEXT)),
+    COALESCE(NULLIF(trim(r.wishlist), ''), 'Пожелания не указаны.')
+FROM pairs p
+LEFT JOIN participants r
+    ON r.chat_id = p.chat_id AND r.user_id = p.receiver_id
+WHERE p.chat_id = ?
+"""
+
+# То же, но только пары, чьи письма ещё не доставлены (для /resend).
+SQL_UNSENT_PAIRS_WITH_WISHES = SQL_PAIRS_WITH_WISHES + " AND p.sent_at IS NULL"
+
+SQL_MARK_SENT = """
+UPDATE pairs
+SET sent_at = CURRENT_TIMESTAMP
+WHERE chat_id = ? AND giver_id = ?
+"""
+
+# Строки вида "даритель → получатель" собираются целиком в SQL
+# (COALESCE и || работают в C), Python остаётся только сгруппировать
+# их по чатам.
+SQL_ALL_PAIRS = """
+SELECT
+    p.chat_id,
+    COALESCE('@' || NULLIF(g.username, ''), NULLIF(g.full_name, ''),
+             CAST(p.giver_id AS TEXT))
+        || ' → ' ||
+    COALESCE('@' || NULLIF(r.username, ''), NULLIF(r.full_name, ''),
+             CAST(p.receiver_id AS TEXT)) AS line
+FROM pairs p
+LEFT JOIN participants g
+    ON g.chat_id = p.chat_id AND g.user_id = p.giver_id
+LEFT JOIN participants r
+    ON r.chat_id = p.chat_id AND r.user_id = p.receiver_id
+ORDER BY p.chat_id, g.full_name, g.username
+"""
 
 
 # ------------------ КОМАНДЫ УЧАСТНИКА ---------------------
+#
+# Синхронные обращения к sqlite вынесены в маленькие _-хелперы и
+# выполняются через asyncio.to_thread, чтобы fsync/чтение диска не
+# блокировали event loop (_DB_LOCK защищает соединение между потоками).
+
+
+def _register_participant(chat_id, user_id, username, full_name):
+    """Регистрирует участника; True, если он добавлен только что"""
+    with db() as conn:
+        cur = conn.execute(
+            SQL_INSERT_PARTICIPANT, (chat_id, user_id, username, full_name)
+        )
+        return cur.fetchone() is not None
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -68,61 +219,53 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # В личке chat_id = user.id; в группе chat_id = id чата
     chat_id = chat.id
 
-    with db() as conn:
-        conn.execute(
-            """
-        INSERT OR IGNORE INTO participants
-        (chat_id, user_id, username, full_name)
-        VALUES (?, ?, ?, ?)
-        """,
-            (chat_id, user.id, user.username, user.full_name),
-        )
+    created = await asyncio.to_thread(
+        _register_participant,
+        chat_id,
+        user.id,
+        normalize_username(user.username),
+        user.full_name,
+    )
 
     await update.message.reply_text(
-        "Ты зарегистрирован(а).\n"
-        "Напиши /wish <текст>, чтобы указать или изменить пожелания."
+        ("Ты зарегистрирован(а).\n" if created else "Ты уже зарегистрирован(а).\n")
+        + "Напиши /wish <текст>, чтобы указать или изменить пожелания."
     )
 
 
+BUTTON_NOTIFY_TEXT = "Отправить дарителю"
+
+
+def _save_wish(chat_id, user_id, username, full_name, text):
+    with db() as conn:
+        conn.execute(SQL_UPSERT_WISH, (chat_id, user_id, username, full_name, text))
+
+
 async def wish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Установка/изменение пожеланий"""
     user = update.effective_user
     chat_id = update.effective_chat.id
-    text = " ".join(context.args).strip()
-
-    if not text:
+    # Быстрый выход для пустого /wish — до сборки строки и похода в БД
+    if not context.args:
         await update.message.reply_text("Напиши: /wish <пожелание>")
         return
 
-    with db() as conn:
-        # На всякий случай регистрируем участника, если его ещё нет
-        conn.execute(
-            """
-        INSERT OR IGNORE INTO participants
-        (chat_id, user_id, username, full_name)
-        VALUES (?, ?, ?, ?)
-        """,
-            (chat_id, user.id, user.username, user.full_name),
-        )
+    text = " ".join(context.args).strip()
 
-        conn.execute(
-            """
-        UPDATE participants
-        SET wishlist = ?
-        WHERE chat_id = ? AND user_id = ?
-        """,
-            (text, chat_id, user.id),
-        )
+    await asyncio.to_thread(
+        _save_wish,
+        chat_id,
+        user.id,
+        normalize_username(user.username),
+        user.full_name,
+        text,
+    )
 
-    keyboard = InlineKeyboardMarkup(
-        [
-            [
-                InlineKeyboardButton(
-                    "Отправить дарителю",
-                    callback_data=f"notify:{chat_id}:{user.id}",
-                )
-            ]
-        ]
+    keyboard = InlineKeyboardMarkup.from_button(
+        InlineKeyboardButton(
+            BUTTON_NOTIFY_TEXT,
+            callback_data=f"notify:{chat_id}:{user.id}",
+        )
     )
 
     await update.message.reply_text(
@@ -132,20 +275,17 @@ async def wish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+def _get_wish(chat_id, user_id):
+    with db() as conn:
+        return conn.execute(SQL_GET_WISH, (chat_id, user_id)).fetchone()
+
+
 async def mywish(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать своё текущее пожелание"""
     user = update.effective_user
     chat_id = update.effective_chat.id
 
-    with db() as conn:
-        row = conn.execute(
-            """
-            SELECT wishlist
-            FROM participants
-            WHERE chat_id = ? AND user_id = ?
-        """,
-            (chat_id, user.id),
-        ).fetchone()
+    row = await asyncio.to_thread(_get_wish, chat_id, user.id)
 
     if not row or not row[0]:
         await update.message.reply_text(
@@ -159,52 +299,39 @@ async def mywish(update: Update, context: ContextTypes.DEFAULT_TYPE):
 # ------------------ КНОПКА "ОТПРАВИТЬ ДАРИТЕЛЮ" ---------------------
 
 
+def _get_giver_and_wish(chat_id, receiver_id):
+    with db() as conn:
+        return conn.execute(SQL_GIVER_AND_WISH, (chat_id, receiver_id)).fetchone()
+
+
 async def notify_giver(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отправка обновленных пожеланий только своему Санте"""
     query = update.callback_query
     await query.answer()
 
-    try:
-        _, chat_id_str, receiver_id_str = query.data.split(":")
-        chat_id = int(chat_id_str)
-        receiver_id = int(receiver_id_str)
-    except Exception:
+    # Разбор "notify:<chat_id>:<user_id>" без try/except на горячем пути
+    prefix, _, rest = query.data.partition(":")
+    chat_id_str, _, receiver_id_str = rest.partition(":")
+    if (
+        prefix != "notify"
+        or not chat_id_str.removeprefix("-").isdecimal()
+        or not receiver_id_str.isdecimal()
+    ):
         await query.edit_message_text("Не удалось разобрать данные кнопки.")
         return
 
-    with db() as conn:
-        # Находим дарителя для этого получателя
-        row = conn.execute(
-            """
-        SELECT giver_id
-        FROM pairs
-        WHERE chat_id = ? AND receiver_id = ?
-        """,
-            (chat_id, receiver_id),
-        ).fetchone()
-
-        if not row:
-            await query.edit_message_text(
-                "Даритель ещё не определён (жеребьёвка не проведена)."
-            )
-            return
+    chat_id = int(chat_id_str)
+    receiver_id = int(receiver_id_str)
 
-        giver_id = row[0]
+    row = await asyncio.to_thread(_get_giver_and_wish, chat_id, receiver_id)
 
-        wish_row = conn.execute(
-            """
-        SELECT wishlist, username, full_name
-        FROM participants
-        WHERE chat_id = ? AND user_id = ?
-        """,
-            (chat_id, receiver_id),
-        ).fetchone()
-
-    if not wish_row:
-        await query.edit_message_text("Пожелание не найдено.")
+    if not row:
+        await query.edit_message_text(
+            "Даритель ещё не определён (жеребьёвка не проведена)."
+        )
         return
 
-    wish, uname, fname = wish_row
+    giver_id, wish = row
 
     # Сообщение дарителю
     await context.bot.send_message(
@@ -222,117 +349,200 @@ async def notify_giver(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def make_pairs(chat_id: int):
     """Создаёт пары для одного чата (без отправки сообщений)"""
     with db() as conn:
-        users = [
-            r[0]
-            for r in conn.execute(
-                "SELECT user_id FROM participants WHERE chat_id = ?",
-                (chat_id,),
-            )
-        ]
+        users = [r[0] for r in conn.execute(SQL_CHAT_PARTICIPANTS, (chat_id,))]
 
     if len(users) < 2:
         return
 
+    # Алгоритм Саттоло: один проход in-place даёт случайный полный цикл —
+    # неподвижных точек не бывает, так что сам себе никто не дарит и
+    # ретраи не нужны даже при 2 участниках.
     shuffled = users[:]
+    for i in range(len(shuffled) - 1, 0, -1):
+        j = _RNG.randrange(i)  # строго < i — этим Саттоло отличается от Фишера-Йетса
+        shuffled[i], shuffled[j] = shuffled[j], shuffled[i]
+    pairs = list(zip(users, shuffled))
+
+    with db() as conn:
+        # Сразу берём write-блокировку: удаление и вставки уезжают в WAL
+        # одной транзакцией (один fsync вместо двух).
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(SQL_DELETE_PAIRS, (chat_id,))
+        conn.executemany(
+            SQL_INSERT_PAIR,
+            ((chat_id, giver, receiver) for giver, receiver in pairs),
+        )
 
-    # Чтобы никто не дарил сам себе
-    for _ in range(1000):
-        random.shuffle(shuffled)
-        if all(a != b for a, b in zip(users, shuffled)):
-            break
-    else:
-        # На всякий случай, если вдруг не удалось (при 2 участниках такое возможно)
-        return
 
+def _pairs_with_wishes(chat_id, only_unsent=False):
+    sql = SQL_UNSENT_PAIRS_WITH_WISHES if only_unsent else SQL_PAIRS_WITH_WISHES
     with db() as conn:
-        conn.execute("DELETE FROM pairs WHERE chat_id = ?", (chat_id,))
-        for giver, receiver in zip(users, shuffled):
-            conn.execute(
-                "INSERT INTO pairs (chat_id, giver_id, receiver_id) VALUES (?, ?, ?)",
-                (chat_id, giver, receiver),
+        return conn.execute(sql, (chat_id,)).fetchall()
+
+
+def _mark_sent(chat_id, giver_id):
+    with db() as conn:
+        conn.execute(SQL_MARK_SENT, (chat_id, giver_id))
+
+
+# Телеграм пускает от бота ~30 сообщений в секунду суммарно — рассылаем
+# параллельно, но не шире этого лимита.
+_SEND_SEM = asyncio.Semaphore(25)
+
+
+async def _send_dm(bot, user_id, text):
+    """Личное сообщение: ограничение частоты + один повтор при 429"""
+    async with _SEND_SEM:
+        try:
+            await bot.send_message(user_id, text)
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(user_id, text)
+
+
+async def _send_pair_dm(bot, chat_id, giver_id, text):
+    await _send_dm(bot, giver_id, text)
+    # Доставку помечаем сразу после отправки: если процесс упадёт
+    # посреди рассылки, /resend дошлёт только тех, кто остался без письма
+    await asyncio.to_thread(_mark_sent, chat_id, giver_id)
+
+
+async def _broadcast_pairs(bot, chat_id, rows):
+    """Рассылает пары дарителям в личку; возвращает число недоставленных"""
+    # Тексты уже готовы (SQL_PAIRS_WITH_WISHES); отправляем всем сразу,
+    # а не по одному round-trip за итерацию
+    results = await asyncio.gather(
+        *(
+            _send_pair_dm(
+                bot,
+                chat_id,
+                giver_id,
+                f"Ты даришь подарок: {receiver_disp}\n\nПожелания:\n{wish}",
             )
+            for giver_id, receiver_disp, wish in rows
+        ),
+        return_exceptions=True,
+    )
+    return sum(1 for r in results if isinstance(r, Exception))
 
 
 async def draw(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Провести жеребьёвку (для текущего чата)"""
+    """Провести жеребьёвку и разослать пары дарителям в личку"""
     chat_id = update.effective_chat.id
-    make_pairs(chat_id)
-    await update.message.reply_text("Жеребьёвка проведена.")
+    await asyncio.to_thread(make_pairs, chat_id)
 
+    rows = await asyncio.to_thread(_pairs_with_wishes, chat_id)
+    if not rows:
+        await update.message.reply_text("Слишком мало участников для жеребьёвки.")
+        return
 
-# ------------------ КОМАНДА АДМИНА: ПОКАЗАТЬ ВСЕ ПАРЫ ---------------------
+    failed = await _broadcast_pairs(context.bot, chat_id, rows)
 
+    if failed:
+        await update.message.reply_text(
+            "Жеребьёвка проведена, но не удалось отправить "
+            f"{failed} из {len(rows)} сообщений "
+            "(возможно, кто-то не открывал личку с ботом). "
+            "/resend дошлёт недоставленные."
+        )
+    else:
+        await update.message.reply_text("Жеребьёвка проведена. Пары разосланы в личку.")
 
-async def pairs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать все пары админу в личке"""
-    user = update.effective_user
-    chat = update.effective_chat
 
-    if not is_admin(user.id):
-        await update.message.reply_text("Эта команда доступна только админу.")
-        return
+async def resend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Дослать пары, которые не удалось доставить при /draw"""
+    chat_id = update.effective_chat.id
 
-    if chat.type != "private":
-        await update.message.reply_text("Пары можно смотреть только в личке с ботом.")
+    rows = await asyncio.to_thread(_pairs_with_wishes, chat_id, True)
+    if not rows:
+        await update.message.reply_text("Недоставленных пар нет.")
         return
 
+    failed = await _broadcast_pairs(context.bot, chat_id, rows)
+
+    if failed:
+        await update.message.reply_text(
+            f"Осталось недоставленных: {failed} из {len(rows)}. "
+            "Попроси участников открыть личку с ботом и повтори /resend."
+        )
+    else:
+        await update.message.reply_text("Все недоставленные пары разосланы.")
+
+
+# ------------------ КОМАНДА АДМИНА: ПОКАЗАТЬ ВСЕ ПАРЫ ---------------------
+
+
+def _all_pairs():
     with db() as conn:
-        rows = conn.execute(
-            """
-        SELECT
-            p.chat_id,
-            p.giver_id,
-            p.receiver_id,
-            g.username,
-            g.full_name,
-            r.username,
-            r.full_name
-        FROM pairs p
-        LEFT JOIN participants g
-            ON g.chat_id = p.chat_id AND g.user_id = p.giver_id
-        LEFT JOIN participants r
-            ON r.chat_id = p.chat_id AND r.user_id = p.receiver_id
-        ORDER BY p.chat_id, g.full_name, g.username
-        """
-        ).fetchall()
+        return conn.execute(SQL_ALL_PAIRS).fetchall()
+
+
+async def pairs_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать все пары админу в личке
+
+    Проверки "только админ" и "только личка" делает фильтр при
+    регистрации хендлера в main(), сюда посторонние апдейты не доходят.
+    """
+    rows = await asyncio.to_thread(_all_pairs)
 
     if not rows:
         await update.message.reply_text("Пары ещё не сформированы.")
         return
 
-    lines = []
-    current_chat = None
-    for (
-        chat_id,
-        giver_id,
-        receiver_id,
-        giver_username,
-        giver_name,
-        receiver_username,
-        receiver_name,
-    ) in rows:
-        if chat_id != current_chat:
-            if current_chat is not None:
-                lines.append("")  # пустая строка между чатами
-            lines.append(f"Чат {chat_id}:")
-            current_chat = chat_id
-
-        giver_disp = display(giver_username, giver_name) or str(giver_id)
-        receiver_disp = display(receiver_username, receiver_name) or str(receiver_id)
-
-        lines.append(f"{giver_disp} → {receiver_disp}")
-
-    text = "\n".join(lines)
+    text = "\n\n".join(
+        f"Чат {chat_id}:\n" + "\n".join(row["line"] for row in chat_rows)
+        for chat_id, chat_rows in groupby(rows, key=itemgetter(0))
+    )
     await update.message.reply_text(text)
 
 
 # ------------------ MAIN ---------------------
 
+# Как часто принудительно сбрасывать WAL в основной файл БД (сек.)
+CHECKPOINT_INTERVAL = 600
+
+
+def _wal_checkpoint():
+    with db() as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+async def _checkpoint_loop():
+    """Не даёт WAL-файлу расти неделями на долгоживущем процессе"""
+    while True:
+        await asyncio.sleep(CHECKPOINT_INTERVAL)
+        await asyncio.to_thread(_wal_checkpoint)
+
+
+# Сильная ссылка на фоновую задачу: asyncio держит задачи только слабо,
+# а Application.create_task до Application.start() их не отслеживает.
+_CHECKPOINT_TASK = None
+
+
+async def _post_init(app):
+    global _CHECKPOINT_TASK
+    _CHECKPOINT_TASK = asyncio.create_task(_checkpoint_loop())
+
+
+async def _post_shutdown(app):
+    if _CHECKPOINT_TASK is not None:
+        _CHECKPOINT_TASK.cancel()
+        try:
+            await _CHECKPOINT_TASK
+        except asyncio.CancelledError:
+            pass
+
 
 def main():
     init_db()
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_init(_post_init)
+        .post_shutdown(_post_shutdown)
+        .build()
+    )
 
     # участники
     app.add_handler(CommandHandler("start", start))
@@ -341,9 +551,17 @@ def main():
 
     # жеребьёвка
     app.add_handler(CommandHandler("draw", draw))
-
-    # админ: показать пары (только в личке)
-    app.add_handler(CommandHandler("pairs", pairs_cmd))
+    app.add_handler(CommandHandler("resend", resend))
+
+    # админ: показать пары (только в личке) — отсев посторонних ещё
+    # на уровне фильтров PTB, до входа в Python-хендлер
+    app.add_handler(
+        CommandHandler(
+            "pairs",
+            pairs_cmd,
+            filters=filters.ChatType.PRIVATE & filters.User(user_id=list(ADMIN_IDS)),
+        )
+    )
 
     # колбэки кнопок
     app.add_handler(CallbackQueryHandler(notify_giver))